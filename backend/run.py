@@ -1,36 +1,194 @@
+import time
+# Started before any other import so BOOT_MS and the startup report cover eager imports too
+_boot_started = time.perf_counter()
+startup_costs = {}
+_startup_mark = _boot_started
+
+
+def _record_startup(name, kind):
+    """Charges the time since the previous mark to `name` as its 'importMs' or 'initMs'."""
+    global _startup_mark
+    now = time.perf_counter()
+    startup_costs.setdefault(name, {})[f"{kind}Ms"] = round((now - _startup_mark) * 1000, 1)
+    _startup_mark = now
+
+
+import atexit
 import os
-import requests
-import fitz  # PyMuPDF
+import importlib
 import io
-import google.generativeai as genai
+import math
 import random
-import razorpay
+import shutil
 import smtplib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from email.message import EmailMessage
-from flask import Flask, request, jsonify, Response
+from functools import wraps
+_record_startup('stdlib', 'import')
+import requests
+_record_startup('requests', 'import')
+from flask import Flask, request, jsonify, Response, make_response
+_record_startup('flask', 'import')
 from flask_cors import CORS
+_record_startup('flask_cors', 'import')
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from functools import wraps
+_record_startup('dotenv', 'import')
 
 # --- 1. Initialization ---
 load_dotenv()
+_record_startup('dotenv', 'init')
 app = Flask(__name__)
+_record_startup('flask', 'init')
 # Configure CORS to allow requests from your frontend's origin
-CORS(app, origins=["http://localhost:5173", "https://librovault031.vercel.app"])  # Adjust port if needed
+# Expose Retry-After (429/503 backoff) and X-Page-Count (page images) to cross-origin JavaScript
+CORS(app, origins=["http://localhost:5173", "https://librovault031.vercel.app"], expose_headers=["Retry-After", "X-Page-Count"])  # Adjust port if needed
+_record_startup('flask_cors', 'init')
+
+
+class ClientRegistry:
+    """Builds upstream clients lazily on first use, once per process.
+
+    Nothing heavy is imported or connected at module import, so workers that never touch
+    PDFs or payments don't pay for them. Clients are dropped in a forked child, so each
+    gunicorn worker builds its own (and its own connection pools) after fork.
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._clients = {}
+        self._errors = {}
+        self.timings = {}
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._clients = {}
+        self.timings = {}
+        self._errors = {}
+        self._locks = {name: threading.Lock() for name in self._specs}
+
+    def register(self, name, module, build=None, required=False):
+        """Registers a client: `module` is imported on first use and `build(module)` returns the client (default: the module)."""
+        self._specs[name] = {'module': module, 'build': build or (lambda m: m), 'required': required}
+        self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        if self._pid != os.getpid():
+            self._reset()
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._locks[name]:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._build(name)
+        return client
+
+    def _build(self, name):
+        spec = self._specs[name]
+        started = time.perf_counter()
+        try:
+            module = importlib.import_module(spec['module'])
+            imported = time.perf_counter()
+            client = spec['build'](module)
+        except Exception as e:
+            self._errors[name] = f"{type(e).__name__}: {e}"
+            print(f"[Error] Failed to initialize {name} client: {e}")
+            raise
+        finished = time.perf_counter()
+        self.timings[name] = {
+            'importMs': round((imported - started) * 1000, 1),
+            'initMs': round((finished - imported) * 1000, 1),
+            'pid': os.getpid()
+        }
+        self._errors.pop(name, None)
+        self._clients[name] = client
+        print(f"[Startup] {name}: import {self.timings[name]['importMs']} ms, init {self.timings[name]['initMs']} ms (pid {os.getpid()})")
+        return client
+
+    def proxy(self, name):
+        return ClientProxy(self, name)
+
+    def prewarm(self, names):
+        """Builds the given clients ahead of the first request; failures are logged, not raised."""
+        for name in names:
+            if name not in self._specs:
+                print(f"[Warning] Unknown client '{name}' in prewarm list, skipping.")
+                continue
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"[Warning] Prewarm of {name} client failed: {e}")
+
+    def required(self):
+        return [name for name, spec in self._specs.items() if spec['required']]
+
+    def status(self):
+        report = {}
+        for name, spec in self._specs.items():
+            if name in self._clients:
+                state = 'ready'
+            elif name in self._errors:
+                state = 'error'
+            else:
+                state = 'idle'
+            report[name] = {'state': state, 'required': spec['required']}
+            if name in self._errors:
+                report[name]['error'] = self._errors[name]
+            if name in self.timings:
+                report[name].update(self.timings[name])
+        return report
 
-# Supabase initialization
-url: str = os.environ.get("SUPABASE_URL")
-service_key: str = os.environ.get("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(url, service_key)
 
-# Gemini AI initialization
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+class ClientProxy:
+    """Module-level stand-in for a registry client; attribute access builds the client on first use."""
+    __slots__ = ('_registry', '_name')
 
-# Razorpay initialization
-razorpay_client = razorpay.Client(
-    auth=(os.environ.get("RAZORPAY_KEY_ID"), os.environ.get("RAZORPAY_KEY_SECRET"))
-)
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name), attr)
+
+
+def _build_supabase(module):
+    return module.create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_SERVICE_KEY"))
+
+def _build_genai(module):
+    module.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+    return module
+
+def _build_razorpay(module):
+    client = module.Client(auth=(os.environ.get("RAZORPAY_KEY_ID"), os.environ.get("RAZORPAY_KEY_SECRET")))
+    # Handlers catch this through razorpay_client so they never import razorpay themselves
+    client.SignatureVerificationError = module.errors.SignatureVerificationError
+    return client
+
+clients = ClientRegistry()
+clients.register('supabase', 'supabase', _build_supabase, required=True)
+clients.register('genai', 'google.generativeai', _build_genai)
+clients.register('razorpay', 'razorpay', _build_razorpay)
+clients.register('fitz', 'fitz')  # PyMuPDF
+
+supabase = clients.proxy('supabase')
+genai = clients.proxy('genai')
+razorpay_client = clients.proxy('razorpay')
+fitz = clients.proxy('fitz')
+
+# Comma-separated client names to build in the background at worker start (e.g. "supabase,fitz").
+# With `gunicorn --preload`, call clients.prewarm(...) from a post_fork hook instead.
+PREWARM_CLIENTS = [name.strip() for name in os.environ.get("PREWARM_CLIENTS", "").split(",") if name.strip()]
+
+# Readiness probe: a real Supabase round trip with a short timeout, cached per worker
+READINESS_PROBE_TIMEOUT = float(os.environ.get("READINESS_PROBE_TIMEOUT", 2))
+READINESS_CACHE_SECONDS = float(os.environ.get("READINESS_CACHE_SECONDS", 5))
 
 # Email Config
 SENDER_EMAIL = os.environ.get("SENDER_EMAIL")
@@ -38,6 +196,14 @@ SENDER_PASSWORD = os.environ.get("SENDER_PASSWORD")
 SMTP_SERVER = os.environ.get("SMTP_SERVER")
 SMTP_PORT = os.environ.get("SMTP_PORT", 587)
 
+# Reader page rendering config
+PAGE_DPI_DEFAULT = 110
+PAGE_DPI_MIN = 36
+PAGE_DPI_MAX = 300
+PAGE_PREFETCH_MAX = 3
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PDF_HANDLE_POOL_SIZE = max(1, int(os.environ.get("PDF_HANDLE_POOL_SIZE", 4)))
+
 # --- 2. Decorator for Authentication ---
 def token_required(f):
     """Decorator to verify Supabase JWT token from Authorization header."""
@@ -68,12 +234,252 @@ def token_required(f):
             return jsonify({'message': f'Token verification failed: {str(e)}'}), 401
     return decorated
 
-# --- 3. Utility: Safe Gemini Call ---
+# --- 3. Admission Control ---
+class TokenBucket:
+    """Classic token bucket: refills at `rate` tokens/second up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Consumes a token; returns 0 if allowed, otherwise seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Per-key token buckets, keeping at most `max_keys` buckets (least-recently-used dropped first)."""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            return bucket.take()
+
+
+class ConcurrencyGate:
+    """Caps in-flight requests per worker; up to `max_waiting` callers queue for `timeout` seconds."""
+
+    def __init__(self, limit, max_waiting, timeout):
+        if limit < 1:
+            raise ValueError(f"Concurrency limit must be at least 1, got {limit}")
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def enter(self):
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if admitted:
+                self.active += 1
+            return admitted
+
+    def leave(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class UserInFlight:
+    """Counts in-flight requests per user so one user can't take every worker slot of a route class."""
+
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError(f"Per-user in-flight limit must be at least 1, got {limit}")
+        self.limit = limit
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def enter(self, key):
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count >= self.limit:
+                return False
+            self._counts[key] = count + 1
+            return True
+
+    def leave(self, key):
+        with self._lock:
+            count = self._counts.get(key, 0) - 1
+            if count > 0:
+                self._counts[key] = count
+            else:
+                self._counts.pop(key, None)
+
+
+# Route classes: token bucket per user (rate/second, burst), per-worker concurrency cap and per-user
+# in-flight cap (None = uncapped; otherwise at least 1). Everything lives in each worker process, so
+# with N gunicorn workers a user's effective limit is up to N x these values; size them per worker.
+ROUTE_LIMITS = {
+    'read': {
+        'rate': float(os.environ.get("READ_RATE_PER_SEC", 5)),
+        'burst': int(os.environ.get("READ_BURST", 30)),
+        'max_concurrent': None,
+        'max_per_user': None,
+    },
+    'stream': {
+        'rate': float(os.environ.get("STREAM_RATE_PER_SEC", 1)),
+        'burst': int(os.environ.get("STREAM_BURST", 4)),
+        'max_concurrent': int(os.environ.get("STREAM_MAX_CONCURRENT", 4)),
+        'max_per_user': int(os.environ.get("STREAM_MAX_PER_USER", 2)),
+    },
+    # Page image/text/count routes: sized for page turns, kept apart from slow full-file streams
+    'render': {
+        'rate': float(os.environ.get("RENDER_RATE_PER_SEC", 4)),
+        'burst': int(os.environ.get("RENDER_BURST", 40)),
+        'max_concurrent': int(os.environ.get("RENDER_MAX_CONCURRENT", 4)),
+        'max_per_user': int(os.environ.get("RENDER_MAX_PER_USER", 2)),
+    },
+    # In-flight Gemini calls are capped by the 'gemini_calls' gate instead, so admin approvals
+    # and uploads that generate summaries are covered too
+    'ai': {
+        'rate': float(os.environ.get("AI_RATE_PER_SEC", 0.1)),
+        'burst': int(os.environ.get("AI_BURST", 5)),
+        'max_concurrent': None,
+        'max_per_user': int(os.environ.get("AI_MAX_PER_USER", 1)),
+    },
+}
+ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING", 8))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 2))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 5))
+
+rate_limiters = {name: RateLimiter(cfg['rate'], cfg['burst']) for name, cfg in ROUTE_LIMITS.items()}
+concurrency_gates = {
+    name: ConcurrencyGate(cfg['max_concurrent'], ADMISSION_MAX_WAITING, ADMISSION_QUEUE_TIMEOUT)
+    for name, cfg in ROUTE_LIMITS.items() if cfg['max_concurrent'] is not None
+}
+user_in_flight = {
+    name: UserInFlight(cfg['max_per_user'])
+    for name, cfg in ROUTE_LIMITS.items() if cfg['max_per_user'] is not None
+}
+# Gates around expensive work inside handlers, whatever route triggers it
+concurrency_gates['gemini_calls'] = ConcurrencyGate(
+    int(os.environ.get("AI_MAX_CONCURRENT", 2)), ADMISSION_MAX_WAITING, ADMISSION_QUEUE_TIMEOUT
+)
+concurrency_gates['pdf_downloads'] = ConcurrencyGate(
+    int(os.environ.get("PDF_DOWNLOAD_MAX_CONCURRENT", 2)), ADMISSION_MAX_WAITING, ADMISSION_QUEUE_TIMEOUT
+)
+admission_stats = {name: {'admitted': 0, 'throttled': 0, 'shed': 0} for name in [*ROUTE_LIMITS, *concurrency_gates]}
+_admission_stats_lock = threading.Lock()
+
+
+class ServerBusy(Exception):
+    """Raised by `gated` when a per-worker gate inside a handler is full."""
+
+
+def _record_admission(route_class, outcome):
+    with _admission_stats_lock:
+        admission_stats[route_class][outcome] += 1
+
+
+def server_busy_response():
+    return jsonify({'error': 'Server is busy. Please try again shortly.'}), 503, {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+
+
+@contextmanager
+def gated(name):
+    """Holds a slot of the named concurrency gate for the duration of the block, or raises ServerBusy."""
+    gate = concurrency_gates[name]
+    if not gate.enter():
+        _record_admission(name, 'shed')
+        raise ServerBusy(f"{name} queue is full")
+    _record_admission(name, 'admitted')
+    try:
+        yield
+    finally:
+        gate.leave()
+
+
+def admission_control(route_class):
+    """Decorator (applied below token_required) enforcing per-user rate and in-flight limits and per-worker concurrency caps.
+
+    Over-rate users and users already at their in-flight cap get 429, a full queue gets 503,
+    all with Retry-After. Held slots are released when the response is closed, so streamed
+    bodies count too.
+    """
+    limiter = rate_limiters[route_class]
+    gate = concurrency_gates.get(route_class)
+    per_user = user_in_flight.get(route_class)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            user_id = current_user.id
+            wait = limiter.acquire(user_id)
+            if wait:
+                _record_admission(route_class, 'throttled')
+                return jsonify({'error': 'Too many requests. Please slow down.'}), 429, {'Retry-After': str(math.ceil(wait))}
+            if gate is None and per_user is None:
+                _record_admission(route_class, 'admitted')
+                return f(current_user, *args, **kwargs)
+
+            if per_user is not None and not per_user.enter(user_id):
+                _record_admission(route_class, 'throttled')
+                return jsonify({'error': 'Too many requests in progress. Please wait for them to finish.'}), 429, {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+            if gate is not None and not gate.enter():
+                if per_user is not None:
+                    per_user.leave(user_id)
+                _record_admission(route_class, 'shed')
+                return server_busy_response()
+            _record_admission(route_class, 'admitted')
+
+            def release():
+                if gate is not None:
+                    gate.leave()
+                if per_user is not None:
+                    per_user.leave(user_id)
+
+            try:
+                response = make_response(f(current_user, *args, **kwargs))
+            except Exception:
+                release()
+                raise
+            response.call_on_close(release)
+            return response
+        return decorated
+    return decorator
+
+# --- 4. Utility: Safe Gemini Call ---
 def safe_generate_content(prompt: str) -> str:
-    """Safely calls Gemini and extracts text, handling potential errors/empty responses."""
+    """Safely calls Gemini and extracts text, handling potential errors/empty responses.
+
+    Raises ServerBusy when the per-worker cap on in-flight Gemini calls is full.
+    """
     try:
         model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        with gated('gemini_calls'):
+            response = model.generate_content(prompt)
 
         # Try common accessors in order of likelihood
         # 1) response.text
@@ -108,11 +514,13 @@ def safe_generate_content(prompt: str) -> str:
             pass
 
         return ""
+    except ServerBusy:
+        raise
     except Exception as e:
         print(f"[Gemini Error] {e}")
         return ""
 
-# --- 4. Utility: Send Email ---
+# --- 5. Utility: Send Email ---
 def send_approval_email(recipient_email, book_title):
     """Sends an email notification when a book is approved."""
     if not all([SENDER_EMAIL, SENDER_PASSWORD, SMTP_SERVER]):
@@ -139,11 +547,265 @@ def send_approval_email(recipient_email, book_title):
         print(f"[Error] Failed to send approval email to {recipient_email}: {e}")
         return False
 
-# --- 5. Application Routes ---
+# --- 6. Utility: Book Access & Page Rendering ---
+def get_accessible_book(current_user, book_id, action='download', columns='file_url, title, is_pro, user_id'):
+    """Loads a book and checks the user may read its file.
+
+    Returns (book, None) on success or (None, (response, status)) when the book
+    is missing or is a PRO book the user has not uploaded or purchased.
+    """
+    user_id = current_user.id
+    role = current_user.user_metadata.get('role', 'user')
+    book_res = supabase.table('books').select(columns).eq('id', book_id).single().execute()
+
+    if not book_res.data:
+        return None, (jsonify({'error': 'Book not found'}), 404)
+
+    book = book_res.data
+    has_access = not book.get('is_pro') or role == 'admin' or book.get('user_id') == user_id
+
+    if not has_access:
+        purchase_res = supabase.table('purchases').select('id').eq('user_id', user_id).eq('book_id', book_id).limit(1).execute()
+        if not purchase_res.data:
+            return None, (jsonify({'error': f'You do not have permission to {action} this book.'}), 403)
+    return book, None
+
+
+class PageCache:
+    """Thread-safe LRU cache of rendered pages and page text, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+
+# MuPDF is not thread-safe across documents either, so every fitz call (open, render, text, close)
+# in this process goes through this lock, including the prefetch thread and the AI summary paths.
+fitz_lock = threading.RLock()
+
+
+class PdfHandle:
+    """An open PyMuPDF document backed by a temp file; only touch `doc` while holding `fitz_lock`."""
+
+    def __init__(self, doc, path):
+        self.doc = doc
+        self.path = path
+        self.page_count = doc.page_count
+
+    def close(self):
+        with fitz_lock:
+            if self.doc is not None:
+                self.doc.close()
+                self.doc = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class PdfHandlePool:
+    """Small per-worker pool of open PDF documents keyed by file URL, evicted least-recently-used.
+
+    Concurrent requests for a file that is still downloading wait on the same download. Temp
+    files live in a per-process directory that close_all() removes at exit.
+    """
+
+    def __init__(self, max_handles):
+        self.max_handles = max_handles
+        self._handles = OrderedDict()
+        self._opening = {}
+        self._lock = threading.Lock()
+        self._tmp_dir = None
+        self._tmp_pid = None
+
+    def _temp_dir(self):
+        # Created lazily per process so forked workers never share (or delete) each other's files
+        with self._lock:
+            if self._tmp_pid != os.getpid():
+                self._tmp_dir = tempfile.mkdtemp(prefix="librovault_pdf_")
+                self._tmp_pid = os.getpid()
+            return self._tmp_dir
+
+    def _open(self, file_url):
+        # Spool to disk so large scanned books are paged in by fitz instead of held in memory;
+        # cold downloads are capped per worker and raise ServerBusy when the queue is full
+        with gated('pdf_downloads'):
+            file_response = requests.get(file_url, stream=True, timeout=30)
+            file_response.raise_for_status()
+            with tempfile.NamedTemporaryFile(suffix=".pdf", dir=self._temp_dir(), delete=False) as tmp:
+                for chunk in file_response.iter_content(chunk_size=1024 * 1024):
+                    tmp.write(chunk)
+                path = tmp.name
+        try:
+            with fitz_lock:
+                return PdfHandle(fitz.open(path, filetype="pdf"), path)
+        except Exception:
+            os.remove(path)
+            raise
+
+    def _acquire(self, file_url):
+        with self._lock:
+            handle = self._handles.get(file_url)
+            if handle is not None:
+                self._handles.move_to_end(file_url)
+                return handle
+            pending = self._opening.get(file_url)
+            if pending is None:
+                pending = self._opening[file_url] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # Another request is already downloading this file; wait for its result
+            return pending.result()
+
+        try:
+            handle = self._open(file_url)
+        except Exception as e:
+            with self._lock:
+                del self._opening[file_url]
+            pending.set_exception(e)
+            raise
+
+        evicted = []
+        with self._lock:
+            del self._opening[file_url]
+            self._handles[file_url] = handle
+            while len(self._handles) > self.max_handles:
+                evicted.append(self._handles.popitem(last=False)[1])
+        pending.set_result(handle)
+        for old in evicted:
+            old.close()
+        return handle
+
+    def page_count(self, file_url):
+        """Returns the page count of an already-open document, or None if it isn't in the pool."""
+        with self._lock:
+            handle = self._handles.get(file_url)
+            return handle.page_count if handle is not None else None
+
+    def run(self, file_url, fn):
+        """Calls fn(doc) under fitz_lock with the pooled document for file_url, opening it if needed."""
+        while True:
+            handle = self._acquire(file_url)
+            with fitz_lock:
+                # The handle may have been evicted and closed between acquire and lock
+                if handle.doc is not None:
+                    return fn(handle.doc)
+
+    def close_all(self):
+        """Closes every open document and removes this process's temp directory."""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            tmp_dir = self._tmp_dir if self._tmp_pid == os.getpid() else None
+        for handle in handles:
+            handle.close()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+page_cache = PageCache(PAGE_CACHE_MAX_BYTES)
+pdf_pool = PdfHandlePool(PDF_HANDLE_POOL_SIZE)
+atexit.register(pdf_pool.close_all)
+prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-prefetch")
+_prefetch_inflight = set()
+_prefetch_lock = threading.Lock()
+
+
+def _build_page(doc, page_index, variant):
+    """Renders a page to image bytes for ('png'|'jpeg', dpi) variants, or extracts its text for ('text',)."""
+    page = doc.load_page(page_index)
+    if variant[0] == 'text':
+        return page.get_text()
+    fmt, dpi = variant
+    pixmap = page.get_pixmap(dpi=dpi)
+    if fmt == 'jpeg':
+        return pixmap.tobytes("jpeg", jpg_quality=80)
+    return pixmap.tobytes("png")
+
+
+def get_page(file_url, page_index, variant):
+    """Returns (content, page_count) for a page, using the render cache when possible.
+
+    Raises IndexError when page_index is outside the document.
+    """
+    key = (file_url, page_index, variant)
+
+    cached = page_cache.get(key)
+    page_count = pdf_pool.page_count(file_url)
+    if cached is not None and page_count is not None:
+        return cached, page_count
+
+    def build(doc):
+        if not 0 <= page_index < doc.page_count:
+            raise IndexError(f"Page {page_index + 1} out of range (1-{doc.page_count})")
+        return _build_page(doc, page_index, variant), doc.page_count
+
+    content, page_count = pdf_pool.run(file_url, build)
+    page_cache.put(key, content)
+    return content, page_count
+
+
+def prefetch_pages(file_url, page_indexes, variant):
+    """Queues neighbouring pages for background rendering into the page cache."""
+    for page_index in page_indexes:
+        key = (file_url, page_index, variant)
+        if key in page_cache:
+            continue
+        with _prefetch_lock:
+            if key in _prefetch_inflight:
+                continue
+            _prefetch_inflight.add(key)
+        prefetch_executor.submit(_prefetch_page, file_url, page_index, variant)
+
+
+def _prefetch_page(file_url, page_index, variant):
+    try:
+        get_page(file_url, page_index, variant)
+    except IndexError:
+        pass
+    except Exception as e:
+        print(f"[Warning] Page prefetch failed for page {page_index + 1}: {e}")
+    finally:
+        with _prefetch_lock:
+            _prefetch_inflight.discard((file_url, page_index, variant))
+
+# --- 7. Application Routes ---
 
 # --- Book Routes ---
 @app.route("/api/books", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_books(current_user):
     """Fetches approved books, optionally filtered by search term and genre, with pagination."""
     try:
@@ -173,6 +835,7 @@ def get_books(current_user):
 
 @app.route("/api/books/<book_id>", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_book_details(current_user, book_id):
     """Fetches details for a single approved book and logs reading history."""
     try:
@@ -194,6 +857,7 @@ def get_book_details(current_user, book_id):
 
 @app.route("/api/books/proxy/<book_id>", methods=['GET'])
 @token_required
+@admission_control('stream')
 def proxy_book_file(current_user, book_id):
     """Securely streams the book PDF file content."""
     try:
@@ -213,23 +877,13 @@ def proxy_book_file(current_user, book_id):
 
 @app.route("/api/books/download/<book_id>", methods=['GET'])
 @token_required
+@admission_control('stream')
 def download_book_file(current_user, book_id):
     """Securely streams the book file with a download header."""
     try:
-        user_id = current_user.id
-        role = current_user.user_metadata.get('role', 'user')
-        book_res = supabase.table('books').select('file_url, title, is_pro, user_id').eq('id', book_id).single().execute()
-
-        if not book_res.data:
-            return jsonify({'error': 'Book not found'}), 404
-
-        book = book_res.data
-        has_access = not book.get('is_pro') or role == 'admin' or book.get('user_id') == user_id
-
-        if not has_access:
-            purchase_res = supabase.table('purchases').select('id').eq('user_id', user_id).eq('book_id', book_id).limit(1).execute()
-            if not purchase_res.data:
-                return jsonify({'error': 'You do not have permission to download this book.'}), 403
+        book, error = get_accessible_book(current_user, book_id)
+        if error:
+            return error
 
         file_url = book.get('file_url')
         file_response = requests.get(file_url, stream=True, timeout=30)
@@ -245,8 +899,104 @@ def download_book_file(current_user, book_id):
         print(f"[Error] download_book_file: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route("/api/books/<book_id>/pages", methods=['GET'])
+@token_required
+@admission_control('render')
+def get_book_page_count(current_user, book_id):
+    """Returns the page count so the reader can paginate without fetching the whole PDF."""
+    try:
+        book, error = get_accessible_book(current_user, book_id, action='read')
+        if error:
+            return error
+        _, page_count = get_page(book['file_url'], 0, ('text',))
+        return jsonify({'bookId': book_id, 'pageCount': page_count}), 200
+    except IndexError:
+        return jsonify({'bookId': book_id, 'pageCount': 0}), 200
+    except ServerBusy:
+        return server_busy_response()
+    except Exception as e:
+        print(f"[Error] get_book_page_count: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route("/api/books/<book_id>/pages/<int:page_number>", methods=['GET'])
+@token_required
+@admission_control('render')
+def get_book_page_image(current_user, book_id, page_number):
+    """Renders a single page as an image at the requested DPI and prefetches the pages after it."""
+    try:
+        try:
+            dpi = int(request.args.get('dpi', PAGE_DPI_DEFAULT))
+            prefetch = int(request.args.get('prefetch', 1))
+        except ValueError:
+            return jsonify({'error': 'dpi and prefetch must be integers.'}), 400
+        fmt = request.args.get('format', 'png').lower()
+        if not (PAGE_DPI_MIN <= dpi <= PAGE_DPI_MAX):
+            return jsonify({'error': f'DPI must be between {PAGE_DPI_MIN} and {PAGE_DPI_MAX}.'}), 400
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt not in ('png', 'jpeg'):
+            return jsonify({'error': 'Format must be png or jpeg.'}), 400
+        if page_number < 1:
+            return jsonify({'error': 'Valid page number is required'}), 400
+
+        book, error = get_accessible_book(current_user, book_id, action='read')
+        if error:
+            return error
+
+        file_url = book['file_url']
+        variant = (fmt, dpi)
+        try:
+            image, page_count = get_page(file_url, page_number - 1, variant)
+        except IndexError:
+            return jsonify({'error': 'Page not found'}), 404
+
+        prefetch = max(0, min(prefetch, PAGE_PREFETCH_MAX))
+        neighbours = [i for i in range(page_number, page_number + prefetch) if i < page_count]
+        if page_number >= 2:
+            neighbours.append(page_number - 2)
+        prefetch_pages(file_url, neighbours, variant)
+
+        headers = {
+            'Cache-Control': 'private, max-age=3600',
+            'X-Page-Count': str(page_count)
+        }
+        return Response(image, mimetype=f'image/{fmt}', headers=headers)
+    except ServerBusy:
+        return server_busy_response()
+    except Exception as e:
+        print(f"[Error] get_book_page_image: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route("/api/books/<book_id>/pages/<int:page_number>/text", methods=['GET'])
+@token_required
+@admission_control('render')
+def get_book_page_text(current_user, book_id, page_number):
+    """Returns the extracted text of a single page (used by the reader's text-to-speech)."""
+    try:
+        if page_number < 1:
+            return jsonify({'error': 'Valid page number is required'}), 400
+        book, error = get_accessible_book(current_user, book_id, action='read')
+        if error:
+            return error
+
+        file_url = book['file_url']
+        try:
+            text, page_count = get_page(file_url, page_number - 1, ('text',))
+        except IndexError:
+            return jsonify({'error': 'Page not found'}), 404
+
+        if page_number < page_count:
+            prefetch_pages(file_url, [page_number], ('text',))
+        return jsonify({'page': page_number, 'pageCount': page_count, 'text': text}), 200
+    except ServerBusy:
+        return server_busy_response()
+    except Exception as e:
+        print(f"[Error] get_book_page_text: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route("/api/books", methods=['POST'])
 @token_required
+@admission_control('read')
 def add_book(current_user):
     """Adds a new book, setting status based on user role and optionally generating AI summary."""
     try:
@@ -276,11 +1026,13 @@ def add_book(current_user):
         if status == 'approved' and not new_book.get('summary'):
             try:
                 file_url = book_data.get('file_url')
-                pdf_response = requests.get(file_url, timeout=30)
-                pdf_response.raise_for_status()
-                doc = fitz.open(stream=io.BytesIO(pdf_response.content), filetype="pdf")
-                text = "".join(page.get_text() for i, page in enumerate(doc) if i < 5)
-                doc.close()
+                with gated('pdf_downloads'):
+                    pdf_response = requests.get(file_url, timeout=30)
+                    pdf_response.raise_for_status()
+                with fitz_lock:
+                    doc = fitz.open(stream=io.BytesIO(pdf_response.content), filetype="pdf")
+                    text = "".join(page.get_text() for i, page in enumerate(doc) if i < 5)
+                    doc.close()
                 if text.strip():
                     ai_summary = safe_generate_content(f"Generate a concise, one-line summary for a library catalog based on this text: {text[:4000]}")
                     if ai_summary:
@@ -296,6 +1048,7 @@ def add_book(current_user):
 # --- Bookmark Routes ---
 @app.route("/api/my-bookmarks", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_all_my_bookmarks(current_user):
     """Fetches the latest unique bookmarks for the current user using a DB function."""
     try:
@@ -317,6 +1070,7 @@ def get_all_my_bookmarks(current_user):
 
 @app.route("/api/bookmarks/<book_id>", methods=['PUT'])
 @token_required
+@admission_control('read')
 def save_bookmark(current_user, book_id):
     """Saves a new bookmark entry for the user and book."""
     try:
@@ -340,6 +1094,7 @@ def save_bookmark(current_user, book_id):
 # --- Rating Routes ---
 @app.route("/api/books/<book_id>/my-rating", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_my_rating(current_user, book_id):
     """Fetches the current user's specific rating for a book."""
     try:
@@ -351,6 +1106,7 @@ def get_my_rating(current_user, book_id):
 
 @app.route("/api/books/<book_id>/rate", methods=['POST'])
 @token_required
+@admission_control('read')
 def rate_book(current_user, book_id):
     """Creates or updates a user's rating for a book."""
     try:
@@ -373,6 +1129,7 @@ def rate_book(current_user, book_id):
 # --- Payment Routes ---
 @app.route("/api/payment/order", methods=['POST'])
 @token_required
+@admission_control('read')
 def create_payment_order(current_user):
     """Creates a Razorpay payment order for a specific book."""
     try:
@@ -411,6 +1168,7 @@ def create_payment_order(current_user):
 
 @app.route("/api/payment/verify", methods=['POST'])
 @token_required
+@admission_control('read')
 def verify_payment(current_user):
     """Verifies a Razorpay payment signature and logs the purchase."""
     try:
@@ -424,7 +1182,7 @@ def verify_payment(current_user):
                 'razorpay_payment_id': data['razorpay_payment_id'],
                 'razorpay_signature': data['razorpay_signature']
             })
-        except razorpay.errors.SignatureVerificationError:
+        except razorpay_client.SignatureVerificationError:
             print("[Error] Payment verification failed: Invalid signature")
             return jsonify({'error': 'Payment verification failed.'}), 400
 
@@ -439,6 +1197,7 @@ def verify_payment(current_user):
 
 @app.route("/api/my-purchases", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_my_purchases(current_user):
     """Fetches a list of book IDs purchased by the current user."""
     try:
@@ -452,6 +1211,7 @@ def get_my_purchases(current_user):
 # --- Admin Routes ---
 @app.route("/api/admin/pending-books", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_pending_books(current_user):
     if current_user.user_metadata.get('role') != 'admin':
         return jsonify({'message': 'Admin access required!'}), 403
@@ -463,6 +1223,7 @@ def get_pending_books(current_user):
 
 @app.route("/api/admin/books/<book_id>/status", methods=['PUT'])
 @token_required
+@admission_control('read')
 def update_book_status(current_user, book_id):
     if current_user.user_metadata.get('role') != 'admin':
         return jsonify({'message': 'Admin access required!'}), 403
@@ -483,11 +1244,13 @@ def update_book_status(current_user, book_id):
             if not original_book_data.get('summary'):
                 try:
                     file_url = book_data.get('file_url')
-                    pdf_response = requests.get(file_url, timeout=30)
-                    pdf_response.raise_for_status()
-                    doc = fitz.open(stream=io.BytesIO(pdf_response.content), filetype="pdf")
-                    text = "".join(page.get_text() for i, page in enumerate(doc) if i < 5)
-                    doc.close()
+                    with gated('pdf_downloads'):
+                        pdf_response = requests.get(file_url, timeout=30)
+                        pdf_response.raise_for_status()
+                    with fitz_lock:
+                        doc = fitz.open(stream=io.BytesIO(pdf_response.content), filetype="pdf")
+                        text = "".join(page.get_text() for i, page in enumerate(doc) if i < 5)
+                        doc.close()
                     if text:
                         summary = safe_generate_content(f"Generate a concise, one-line summary based on this text: {text[:4000]}")
                         if summary:
@@ -509,6 +1272,7 @@ def update_book_status(current_user, book_id):
 
 @app.route("/api/admin/users", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_all_users(current_user):
     if current_user.user_metadata.get('role') != 'admin':
         return jsonify({'message': 'Admin access required!'}), 403
@@ -522,6 +1286,7 @@ def get_all_users(current_user):
 
 @app.route("/api/admin/stats/users", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_user_stats(current_user):
     if current_user.user_metadata.get('role') != 'admin':
         return jsonify({'message': 'Admin access required!'}), 403
@@ -533,6 +1298,7 @@ def get_user_stats(current_user):
 
 @app.route("/api/admin/stats/activity", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_activity_stats(current_user):
     if current_user.user_metadata.get('role') != 'admin':
         return jsonify({'message': 'Admin access required!'}), 403
@@ -544,6 +1310,7 @@ def get_activity_stats(current_user):
 
 @app.route("/api/admin/stats/system", methods=['GET'])
 @token_required
+@admission_control('read')
 def get_system_stats(current_user):
     if current_user.user_metadata.get('role') != 'admin':
         return jsonify({'message': 'Admin access required!'}), 403
@@ -563,9 +1330,27 @@ def get_system_stats(current_user):
         print(f"[Error] get_system_stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route("/api/admin/stats/admission", methods=['GET'])
+@token_required
+@admission_control('read')
+def get_admission_stats(current_user):
+    """Reports admitted/throttled/shed counts and in-flight load per route class.
+
+    Counters live in each gunicorn worker, so this is only the slice of traffic seen by the
+    worker that served the request (identified by `worker`), not a service-wide total.
+    """
+    if current_user.user_metadata.get('role') != 'admin':
+        return jsonify({'message': 'Admin access required!'}), 403
+    with _admission_stats_lock:
+        counts = {name: dict(values) for name, values in admission_stats.items()}
+    for name, gate in concurrency_gates.items():
+        counts[name].update({'inFlight': gate.active, 'queued': gate.waiting, 'maxConcurrent': gate.limit})
+    return jsonify({'scope': 'worker', 'worker': os.getpid(), 'routeClasses': counts}), 200
+
 # --- AI Routes ---
 @app.route("/api/ai/recommendations", methods=['GET'])
 @token_required
+@admission_control('ai')
 def get_recommendations(current_user):
     try:
         history_res = supabase.table('reading_history').select('books(title, genre)').eq('user_id', current_user.id).order('read_at', desc=True).limit(5).execute()
@@ -622,12 +1407,15 @@ def get_recommendations(current_user):
 
         recs = supabase.table('books').select('*').in_('title', recommended_titles).execute()
         return jsonify({'recommendations': recs.data or []}), 200
+    except ServerBusy:
+        return server_busy_response()
     except Exception as e:
         print(f"Recommendation error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route("/api/ai/discover", methods=['POST'])
 @token_required
+@admission_control('ai')
 def discover_recommendations(current_user):
     try:
         data = request.get_json()
@@ -652,9 +1440,66 @@ def discover_recommendations(current_user):
             return jsonify({'recommendations': []}), 200
         recs = supabase.table('books').select('*').in_('title', recommended_titles).execute()
         return jsonify({'recommendations': recs.data or []}), 200
+    except ServerBusy:
+        return server_busy_response()
     except Exception as e:
         print(f"[Error] Discover recommendations failed: {e}")
         return jsonify({'error': str(e)}), 500
+# --- Readiness Check ---
+_readiness_cache = {'checked': 0.0, 'result': None}
+_readiness_lock = threading.Lock()
+
+
+def probe_supabase():
+    """Runs a one-row query against the Supabase REST API; returns {'ok', 'latencyMs'[, 'error']}."""
+    started = time.perf_counter()
+    try:
+        service_key = os.environ.get("SUPABASE_SERVICE_KEY")
+        response = requests.get(
+            f"{os.environ.get('SUPABASE_URL', '').rstrip('/')}/rest/v1/books",
+            params={'select': 'id', 'limit': 1},
+            headers={'apikey': service_key, 'Authorization': f"Bearer {service_key}"},
+            timeout=READINESS_PROBE_TIMEOUT
+        )
+        response.raise_for_status()
+        result = {'ok': True}
+    except Exception as e:
+        result = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    result['latencyMs'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def cached_supabase_probe():
+    """Returns the last probe result if it is fresh enough, otherwise probes again (one caller at a time)."""
+    with _readiness_lock:
+        now = time.monotonic()
+        if _readiness_cache['result'] is None or now - _readiness_cache['checked'] > READINESS_CACHE_SECONDS:
+            _readiness_cache['result'] = probe_supabase()
+            _readiness_cache['checked'] = time.monotonic()
+        return dict(_readiness_cache['result'], ageSeconds=round(time.monotonic() - _readiness_cache['checked'], 1))
+
+
+@app.route("/api/health/ready", methods=["GET"])
+def readiness_check():
+    """Readiness probe: builds required clients in this worker, checks Supabase is reachable and reports client state."""
+    ready = True
+    for name in clients.required():
+        try:
+            clients.get(name)
+        except Exception:
+            ready = False
+    supabase_probe = cached_supabase_probe()
+    ready = ready and supabase_probe['ok']
+    body = {
+        'status': 'ready' if ready else 'unavailable',
+        'worker': os.getpid(),
+        'bootMs': BOOT_MS,
+        'startup': startup_costs,
+        'supabaseProbe': supabase_probe,
+        'clients': clients.status()
+    }
+    return jsonify(body), 200 if ready else 503
+
 # --- Root Route for Render Health Check ---
 @app.route("/", methods=["GET"])
 def home():
@@ -665,6 +1510,14 @@ def home():
         "version": "1.0.0"
     }), 200
 
-# --- 6. Run the App ---
+# --- 8. Startup Report & Prewarm ---
+BOOT_MS = round((time.perf_counter() - _boot_started) * 1000, 1)
+for _name, _cost in startup_costs.items():
+    print(f"[Startup] {_name}: import {_cost.get('importMs', 0.0)} ms, init {_cost.get('initMs', 0.0)} ms")
+print(f"[Startup] App loaded in {BOOT_MS} ms (pid {os.getpid()}); deferred until first use: {', '.join(clients.status())}")
+if PREWARM_CLIENTS:
+    threading.Thread(target=clients.prewarm, args=(PREWARM_CLIENTS,), name="client-prewarm", daemon=True).start()
+
+# --- 9. Run the App ---
 if __name__ == "__main__":
     app.run(debug=True)